@@ -1,16 +1,72 @@
-import json
+import functools
+import gzip
 import logging
 import os
+import numpy as np
 import trimesh
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from typing import Union, Text, List
 import util
 
+try:
+    import cupy
+except ImportError:
+    cupy = None
+
 log = logging.getLogger("STL Slicer")
 log.setLevel(logging.DEBUG)
 trimesh.util.attach_to_log()
 
 STR_DATETIME_FORMAT = "%Y%m%d-%H%M%S"
+Z_AXIS = [0.0, 0.0, 1.0]
+
+# assumed L2 cache size per core, for cache-blocking the slicing
+L2_BYTES = 1 << 20
+
+# one thread per (candidate triangle, layer), `real_t` is float or double
+CUDA_SECTION_SOURCE = r"""
+extern "C" __global__
+void section_z(const real_t* triangles, const long long* starts,
+               const long long* stops, const real_t* z,
+               const int max_segments, int* counts,
+               real_t* segments, long long* faces)
+{
+    const int layer = blockIdx.y;
+    const long long f = starts[layer]
+        + (long long)blockIdx.x * blockDim.x + threadIdx.x;
+    if (f >= stops[layer]) return;
+
+    const real_t* tri = triangles + 9 * f;
+    real_t d[3];
+    bool above[3];
+    for (int i = 0; i < 3; i++) {
+        d[i] = tri[3 * i + 2] - z[layer];
+        above[i] = d[i] > 0;
+    }
+
+    // interpolate each crossing edge from its vertex below to its vertex above
+    real_t p[4];
+    int n = 0;
+    for (int i = 0; i < 3; i++) {
+        const int j = (i + 1) % 3;
+        if (above[i] == above[j]) continue;
+        const int a = above[i] ? j : i;
+        const int b = above[i] ? i : j;
+        const real_t t = d[a] / (d[a] - d[b]);
+        p[2 * n] = tri[3 * a] + t * (tri[3 * b] - tri[3 * a]);
+        p[2 * n + 1] = tri[3 * a + 1] + t * (tri[3 * b + 1] - tri[3 * a + 1]);
+        n++;
+    }
+    if (n != 2 || (p[0] == p[2] && p[1] == p[3])) return;
+
+    const int slot = atomicAdd(&counts[layer], 1);
+    if (slot >= max_segments) return;
+    const long long out = (long long)layer * max_segments + slot;
+    for (int i = 0; i < 4; i++) segments[4 * out + i] = p[i];
+    faces[out] = f;
+}
+"""
 
 
 class STLSlicer:
@@ -21,10 +77,26 @@ class STLSlicer:
         self.filename: Text = ""
         self.mesh = None
         self.mesh_watertight: bool = False
-
-    def load_mesh(self, f: Union[str, bytes, os.PathLike]):
+        self.use_fp32: bool = False
+        # triangles sorted by their lowest z, see `_build_z_index`
+        self._tri = None
+        self._tri_zmin = None
+        self._tri_zmax = None
+        self._tri_zmax_sorted = None
+        self._tri_order = None
+        self._tri_tallest = 0.0
+        # device copy of `_tri` for the cuda backend
+        self._tri_gpu = None
+        # edge arrays for `fast_slice`, see `_build_edge_index`
+        self._edge_index = None
+
+    def load_mesh(self, f: Union[str, bytes, os.PathLike], use_fp32: bool = False):
         """
         :param f: Filename
+        :param use_fp32: Slice with float32 instead of float64 coordinates.
+            Halves the memory traffic of the intersection, the error is in
+            the order of 1e-5mm for coordinates within +-250mm. The mesh
+            itself and its repair keep float64.
         Import meshes from binary/ASCII STL, Wavefront OBJ, ASCII OFF,
         binary/ASCII PLY, GLTF/GLB 2.0, 3MF, XAML, 3DXML, etc.
 
@@ -34,28 +106,75 @@ class STLSlicer:
         to preserve the original loaded data without merging vertices
         STL files will be a soup of disconnected triangles without
         merging vertices however and will not register as watertight.
+
+        A soup is never watertight, so `repair_mesh_watertight` merges the
+        vertices of every STL on load. The cached, parsed mesh stays
+        unmerged and only saves the parsing, the merge is paid on every
+        load in exchange for a correct `mesh_watertight`.
         """
         self.full_filename = f
         self.filename = os.path.splitext(f)[0]
+        self.use_fp32 = use_fp32
         try:
-            self.mesh = trimesh.load(f, process=False)
+            # copy, so repairs do not alter the cached mesh
+            self.mesh = _load_stl(f, os.path.getmtime(f)).copy()
             self.mesh.units = "mm"
             log.info(f"File '{f}' loaded. Units set to '{self.mesh.units}'.")
         except Exception as e:
             log.info(f"File '{f}' not loaded. ERROR: {e}")
             raise e
 
-        if repair_mesh_watertight(self.mesh):
-            self.mesh_watertight = True
+        self.mesh_watertight = repair_mesh_watertight(self.mesh)
+        if self.mesh_watertight:
             log.debug(f"Mesh is watertight.")
 
-    def slice_mesh(self, distance: float = None):
+        self._build_z_index()
+
+    def _build_z_index(self):
+        """
+        Sort the triangles of the mesh by their lowest z once, so every
+        `slice_mesh` call finds the candidates of a plane with a binary
+        search instead of scanning all faces.
+        """
+        triangles = self.mesh.triangles.astype(self._dtype, copy=False)
+        tri_z = triangles[:, :, 2]
+        tri_zmin = tri_z.min(axis=1)
+        self._tri_order = np.argsort(tri_zmin, kind="stable")
+        self._tri = np.ascontiguousarray(triangles[self._tri_order])
+        self._tri_zmin = tri_zmin[self._tri_order]
+        self._tri_zmax = tri_z.max(axis=1)[self._tri_order]
+        self._tri_zmax_sorted = np.sort(self._tri_zmax)
+        self._tri_tallest = _tallest(self._tri_zmin, self._tri_zmax)
+        self._tri_gpu = None
+        self._edge_index = None
+
+    @property
+    def _dtype(self):
+        """
+        Float type of the coordinates used for slicing.
+        """
+        return np.float32 if self.use_fp32 else np.float64
+
+    def slice_mesh(
+        self,
+        distance: float = None,
+        workers: int = None,
+        backend: Text = "cpu",
+        plane_normal=None,
+    ):
         """
         Slice meshes with one or multiple arbitrary planes and return the
         resulting surface
 
+        The layer heights are split into `workers` contiguous chunks which
+        are sliced in parallel processes. `workers=1` slices in-process.
+        `backend="cuda"` intersects all layers on the GPU with cupy instead.
+        Any `plane_normal` other than Z falls back to
+        `Trimesh.section_multiplane()` and ignores `workers` and `backend`.
+
         +++
-        Uses: Trimesh.section_multiplane()`
+        Uses: `STLSlicer._section_z()`, a drop-in for
+        `Trimesh.section_multiplane()`
 
             Returns multiple parallel cross sections of the current mesh in 2D.
 
@@ -77,64 +196,401 @@ class STLSlicer:
               to return 2D section back into 3D space.
         +++
 
+        :param distance: Distance between two layers.
+        :param workers: Number of worker processes. Default: `os.cpu_count()`.
+        :param backend: [`cpu`, `cuda`]
+        :param plane_normal: (3, ) Normal of the planes. Default: Z.
         :return:
         """
+        if plane_normal is not None:
+            plane_normal = trimesh.unitize(plane_normal)
+            if np.allclose(plane_normal, Z_AXIS):
+                plane_normal = None
+        origin, heights = self._layer_heights(distance, plane_normal)
+
+        if plane_normal is None:
+            slices_2D = self._section_z(origin, heights, workers, backend)
+        else:
+            slices_2D = list(
+                self.mesh.section_multiplane(
+                    plane_origin=origin, plane_normal=plane_normal, heights=heights
+                )
+            )
+
+        layers = {}
+        for i in range(len(slices_2D)):
+            layers[float(heights[i])] = slices_2D[i]
+
+        self.layers = layers
+
+        return layers
+
+    def fast_slice(self, distance: float = None):
+        """
+        Slice the mesh like `slice_mesh`, intersecting the unique edges of
+        the mesh with a whole tile of planes in one NumPy broadcast. Tiles
+        are sized so the distances of the edges reaching them fit into L2.
+
+        Contours are stitched per layer through the faces shared by the
+        intersected edges instead of matching segment end points.
+
+        :param distance: Distance between two layers.
+        :return: Dictionary of layer height and `trimesh.Path2D` or None
+        """
+        origin, heights = self._layer_heights(distance)
+        origin = np.asanyarray(origin, dtype=self._dtype)
+        if self._edge_index is None:
+            self._edge_index = self._build_edge_index()
+        edge_index = self._edge_index
+        ex0, ex1 = edge_index["x0"], edge_index["x1"]
+        ey0, ey1 = edge_index["y0"], edge_index["y1"]
+        ez0, ez1 = edge_index["z0"], edge_index["z1"]
+        edge_faces = edge_index["faces"]
+        edge_face_count = edge_index["face_count"]
+        edge_face_start = edge_index["face_start"]
+
+        z_all = origin[2] + heights.astype(self._dtype)
+        starts, stops = _z_candidates(edge_index["zmin"], edge_index["tallest"], z_all)
+        row_bytes = 2 * ez0.itemsize
+
+        layers = {}
+        k0 = 0
+        while k0 < len(z_all):
+            # grow the tile while its (E_tile, 2, K) distances fit into L2
+            k1 = k0 + 1
+            while (
+                k1 < len(z_all)
+                and (stops[k1] - starts[k0]) * (k1 + 1 - k0) * row_bytes <= L2_BYTES
+            ):
+                k1 += 1
+            e0, e1 = starts[k0], stops[k1 - 1]
+            z = z_all[k0:k1]
+
+            # signed distance of both edge end points to every plane,
+            # only the z arrays are read for the whole tile
+            dist0 = ez0[e0:e1, None] - z[None, :]
+            dist1 = ez1[e0:e1, None] - z[None, :]
+            crossing = (dist0 > 0) != (dist1 > 0)
+            # (layer, edge) pairs sorted by layer
+            k, e = np.nonzero(crossing.T)
+            d0 = dist0[e, k]
+            d1 = dist1[e, k]
+            e += e0
+            # x and y are only gathered for the intersected edges
+            t = d0 / (d0 - d1)
+            points = np.column_stack(
+                (ex0[e] + t * (ex1[e] - ex0[e]), ey0[e] + t * (ey1[e] - ey0[e]))
+            )
+            points -= origin[:2]
+
+            bounds = np.searchsorted(k, np.arange(len(z) + 1))
+            for i in range(len(z)):
+                b0, b1 = bounds[i], bounds[i + 1]
+                layer_edges = e[b0:b1]
+                # every intersected face has exactly two intersected edges
+                count = edge_face_count[layer_edges]
+                node = np.repeat(np.arange(len(layer_edges)), count)
+                offset = np.repeat(
+                    edge_face_start[layer_edges] - (np.cumsum(count) - count), count
+                )
+                face = edge_faces[offset + np.arange(len(node))]
+                order = np.argsort(face, kind="stable")
+                segments = node[order].reshape((-1, 2))
+
+                layers[float(heights[k0 + i])] = _stitch_path(
+                    points[b0:b1],
+                    segments,
+                    origin,
+                    heights[k0 + i],
+                    face[order][::2],
+                )
+            k0 = k1
+
+        self.layers = layers
+
+        return layers
+
+    def _build_edge_index(self):
+        """
+        Unique edges of the welded mesh for `fast_slice`, sorted by their
+        lowest z and stored as separate contiguous coordinate arrays, so
+        the plane test only streams the z values.
+
+        :return: Dictionary of edge arrays.
+        """
+        # weld the vertex soup, so neighbouring faces share their edges
+        unique, inverse = trimesh.grouping.unique_rows(self.mesh.vertices)
+        vertices = self.mesh.vertices[unique].astype(self._dtype)
+        faces = inverse[self.mesh.faces]
+        face_ids = np.flatnonzero(
+            (faces[:, 0] != faces[:, 1])
+            & (faces[:, 1] != faces[:, 2])
+            & (faces[:, 2] != faces[:, 0])
+        )
+        faces = faces[face_ids]
+
+        # unique edges (E, 2) and the edges (0, 1), (1, 2), (2, 0) of each face
+        edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape((-1, 2)), axis=1)
+        edges_unique, face_edges = trimesh.grouping.unique_rows(edges)
+
+        # sort the edges by their lowest z, so the edges reaching a range of
+        # planes are a contiguous range as well, like the triangle z-index
+        edge_z = vertices[edges[edges_unique], 2]
+        order = np.argsort(edge_z.min(axis=1), kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        edges = edges[edges_unique[order]]
+        face_edges = rank[face_edges]
+        edge_zmin = edge_z.min(axis=1)[order]
+        edge_zmax = edge_z.max(axis=1)[order]
+
+        # edge -> faces lookup, CSR-style
+        face_count = np.bincount(face_edges, minlength=len(edges))
+
+        return {
+            "x0": np.ascontiguousarray(vertices[edges[:, 0], 0]),
+            "x1": np.ascontiguousarray(vertices[edges[:, 1], 0]),
+            "y0": np.ascontiguousarray(vertices[edges[:, 0], 1]),
+            "y1": np.ascontiguousarray(vertices[edges[:, 1], 1]),
+            "z0": np.ascontiguousarray(vertices[edges[:, 0], 2]),
+            "z1": np.ascontiguousarray(vertices[edges[:, 1], 2]),
+            "zmin": edge_zmin,
+            "tallest": _tallest(edge_zmin, edge_zmax),
+            "faces": face_ids[np.argsort(face_edges, kind="stable") // 3],
+            "face_count": face_count,
+            "face_start": np.cumsum(face_count) - face_count,
+        }
+
+    def _layer_heights(self, distance: float = None, plane_normal=None):
+        """
+        Layer heights from the bottom of the mesh.
+
+        :param distance: Distance between two layers.
+        :param plane_normal: (3, ) Unit normal of the planes. Default: Z.
+        :return: Origin of the lowest plane and (n, ) heights above it.
+        """
         distance = distance or self.distance
 
-        # bounds = [[x_min,y_min,z_min],
-        #           [x_max,y_max,z_max]]
-        bounds: List = self.mesh.bounds
-        z_min: float = bounds[0, 2]
-        z_max: float = bounds[1, 2]
-        origin = list(self.mesh.centroid[:2]) + [z_min]
+        if plane_normal is None:
+            # bounds = [[x_min,y_min,z_min],
+            #           [x_max,y_max,z_max]]
+            bounds: List = self.mesh.bounds
+            z_min: float = bounds[0, 2]
+            z_max: float = bounds[1, 2]
+            origin = list(self.mesh.centroid[:2]) + [z_min]
+        else:
+            # extent of the mesh along the normal, the lowest plane
+            # passes through the projection of the centroid
+            projected = self.mesh.vertices @ plane_normal
+            z_min = projected.min()
+            z_max = projected.max()
+            centroid = self.mesh.centroid
+            origin = list(centroid + (z_min - centroid @ plane_normal) * plane_normal)
         no_of_planes = int((z_max - z_min) / distance)
-        z_list = [i * distance for i in range(no_of_planes + 1)]
+        heights = np.arange(no_of_planes + 1, dtype=np.float64) * distance
         log.debug(
-            f"Layer heights between {z_list[0]}{self.mesh.units} and "
-            f"{z_list[-1]}{self.mesh.units}. "
-            f"Distance: {distance}{self.mesh.units}. Count: {len(z_list)}."
+            f"Layer heights between {heights[0]}{self.mesh.units} and "
+            f"{heights[-1]}{self.mesh.units}. "
+            f"Distance: {distance}{self.mesh.units}. Count: {len(heights)}."
         )
 
-        slices_2D = self.mesh.section_multiplane(
-            plane_origin=origin, plane_normal=[0, 0, 1], heights=z_list
+        return origin, heights
+
+    def _section_z(self, origin, heights, workers: int = None, backend: Text = "cpu"):
+        """
+        Slice with planes orthogonal to Z without going through
+        `Trimesh.section_multiplane()`.
+
+        The plane distance of a vertex is just `z - height`, no translation
+        to the plane origin and no projection onto the normal.
+
+        :param origin: (3, ) Point on the plane at height 0.
+        :param heights: (n, ) Ascending offsets along Z from `origin`.
+        :param workers: Number of worker processes. Default: `os.cpu_count()`.
+        :param backend: [`cpu`, `cuda`]
+        :return: (n, ) `trimesh.Path2D` or None
+        """
+        workers = workers or os.cpu_count() or 1
+
+        if backend == "cuda" and cupy is None:
+            log.warning("Backend 'cuda' needs cupy. Slicing on the CPU.")
+            backend = "cpu"
+
+        # layers without any triangle reaching their plane stay None,
+        # only the others are dispatched
+        z = np.asanyarray(origin, dtype=self._dtype)[2] + heights.astype(self._dtype)
+        active = np.flatnonzero(self._layer_counts(z))
+        log.debug(f"Skipping {len(heights) - len(active)} empty layers.")
+
+        if backend == "cuda":
+            sections = self._cuda_section(origin, heights[active])
+        elif workers == 1 or len(active) < 2:
+            sections = self._fast_section(origin, heights[active])
+        else:
+            # contiguous chunks keep the results in the order of `heights`
+            chunk_size = -(-len(active) // workers)
+            chunks = [
+                active[i : i + chunk_size] for i in range(0, len(active), chunk_size)
+            ]
+            with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+                # only send the triangles reaching into the chunk's z-range,
+                # bounded by the planes as the workers compute them
+                futures = []
+                for chunk in chunks:
+                    starts, stops = self._z_candidates(z[chunk[[0, -1]]])
+                    index = slice(starts[0], stops[-1])
+                    futures.append(
+                        executor.submit(
+                            _section_triangles,
+                            self._tri[index],
+                            self._tri_zmin[index],
+                            self._tri_zmax[index],
+                            self._tri_order[index],
+                            origin,
+                            heights[chunk],
+                        )
+                    )
+                sections = [path2D for future in futures for path2D in future.result()]
+
+        slices_2D = [None] * len(heights)
+        for i, path2D in zip(active, sections):
+            slices_2D[i] = path2D
+
+        return slices_2D
+
+    def _fast_section(self, origin, heights):
+        """
+        Z-plane replacement for `Trimesh.section_multiplane()`.
+
+        Each layer only intersects the triangles reaching its plane, found
+        in the z-index built by `load_mesh`.
+
+        :param origin: (3, ) Point on the plane at height 0.
+        :param heights: (n, ) Ascending offsets along Z from `origin`.
+        :return: (n, ) `trimesh.Path2D` or None
+        """
+        return _section_triangles(
+            self._tri,
+            self._tri_zmin,
+            self._tri_zmax,
+            self._tri_order,
+            origin,
+            heights,
         )
 
-        layers = {}
-        for i in range(len(slices_2D)):
-            layers[z_list[i]] = slices_2D[i]
+    def _cuda_section(self, origin, heights):
+        """
+        GPU version of `_fast_section`, every candidate triangle of every
+        layer is intersected by its own CUDA thread.
 
-        self.layers = layers
+        :param origin: (3, ) Point on the plane at height 0.
+        :param heights: (n, ) Ascending offsets along Z from `origin`.
+        :return: (n, ) `trimesh.Path2D` or None
+        """
+        dtype = self._tri.dtype
+        origin = np.asanyarray(origin, dtype=dtype)
+        z = origin[2] + np.asanyarray(heights, dtype=dtype)
+        starts, stops = self._z_candidates(z)
+        widths = stops - starts
+
+        if self._tri_gpu is None:
+            # stays on the device for repeated slicing, allocations are
+            # served from cupy's default memory pool
+            self._tri_gpu = cupy.asarray(self._tri)
+        kernel = _cuda_kernel("float" if dtype == np.float32 else "double")
+
+        paths = [None] * len(heights)
+        # layers per launch, bounds the segment buffer to 2**24 segments
+        group = max(1, min(65535, (1 << 24) // max(1, int(widths.max(initial=0)))))
+        for k0 in range(0, len(z), group):
+            k1 = min(k0 + group, len(z))
+            # no layer has more segments than candidate triangles
+            max_segments = int(widths[k0:k1].max())
+            if max_segments == 0:
+                continue
+            counts = cupy.zeros(k1 - k0, dtype=cupy.int32)
+            segments = cupy.empty((k1 - k0, max_segments, 4), dtype=dtype)
+            faces = cupy.empty((k1 - k0, max_segments), dtype=cupy.int64)
+            kernel(
+                (-(-max_segments // 256), k1 - k0),
+                (256,),
+                (
+                    self._tri_gpu,
+                    cupy.asarray(starts[k0:k1], dtype=cupy.int64),
+                    cupy.asarray(stops[k0:k1], dtype=cupy.int64),
+                    cupy.asarray(z[k0:k1]),
+                    np.int32(max_segments),
+                    counts,
+                    segments,
+                    faces,
+                ),
+            )
+            counts = counts.get()
+            segments = segments.get()
+            faces = faces.get()
+            for i, count in enumerate(counts):
+                if count == 0:
+                    continue
+                paths[k0 + i] = _segments_path(
+                    segments[i, :count].reshape((-1, 2, 2)),
+                    self._tri_order[faces[i, :count]],
+                    origin,
+                    heights[k0 + i],
+                )
+        return paths
 
-        return layers
+    def _layer_counts(self, z):
+        """
+        Number of triangles reaching the planes at `z`, in O(log F) each.
+
+        :param z: (n, ) Absolute heights of the planes.
+        :return: (n, ) int
+        """
+        # triangles starting at or below z minus those ending below z
+        return np.searchsorted(self._tri_zmin, z, side="right") - np.searchsorted(
+            self._tri_zmax_sorted, z, side="left"
+        )
 
-    def export_layers(self, exp_type: Text = "json", layers=None):
+    def _z_candidates(self, z):
         """
-        Exports all layers. Possible file-types: `json`, `dxf`, `svg`.
+        Range of the sorted triangles which may reach the planes at `z`.
+
+        :param z: (n, ) Absolute heights of the planes.
+        :return: (n, ) start and (n, ) stop indices into the z-index.
+        """
+        return _z_candidates(self._tri_zmin, self._tri_tallest, z)
+
+    def export_layers(self, exp_type: Text = "json.gz", layers=None):
+        """
+        Exports all layers. Possible file-types: `json.gz`, `json`, `dxf`, `svg`.
+
+        `json.gz` is the JSON export gzipped at level 1, which is fast enough
+        to shrink the repetitive coordinates without slowing down the export.
 
         :param layers: List of `trimesh.Path2D` objects.
-        :param exp_type: [`json`, `dxf`, `svg`]
+        :param exp_type: [`json.gz`, `json`, `dxf`, `svg`]
         :return: True if successful.
         """
 
         layers = layers or self.layers
 
-        # Build dictionary
+        # Build dictionary, the layers are streamed into the file separately
         slice_data = {
             "source": self.full_filename,
             "units": str(self.mesh.units),
             "watertight": self.mesh_watertight,
-            "layers": layers,
         }
 
         # Export to JSON
-        if exp_type == "json":
+        if exp_type in ["json", "json.gz"]:
             exp_filename = f"{self.filename}.{exp_type}"
-            with open(exp_filename, "w") as exp_file:
-                # NumpyArrayEncoder handles the transformation of Path2D objects
-                exp_string = json.dumps(
-                    slice_data, cls=util.NumpyArrayEncoder, indent=2
-                )
-                exp_file.write(exp_string)
+            if exp_type == "json.gz":
+                exp_file = gzip.open(exp_filename, "wb", compresslevel=1)
+            else:
+                exp_file = open(exp_filename, "wb")
+            with exp_file:
+                # util handles the transformation of Path2D objects
+                util.dump_members(exp_file, slice_data, "layers", layers.items())
                 log.debug(f"Export to {exp_filename} finished.")
 
             return True
@@ -153,24 +609,10 @@ class STLSlicer:
 
             base_name = os.path.split(self.filename)[1]
 
-            # export to visual file-types
-            with open(f"{dir_name}/{base_name}_info.json", "w") as json_file:
-                json_dict = slice_data.copy()
-                layers = json_dict.pop("layers")
-                json_dict["files"] = {}
-
-                for height, path2D in layers.items():
-                    layer_filename_full = f"{dir_name}/{base_name}_{height}.{exp_type}"
-                    try:
-                        path2D.export(file_obj=layer_filename_full, file_type=exp_type)
-                        json_dict["files"][height] = layer_filename_full
-                    except AttributeError:
-                        log.debug(
-                            f"{layer_filename_full} not created. No data to display."
-                        )
-
-                exp_string = json.dumps(json_dict, cls=util.NumpyArrayEncoder, indent=2)
-                json_file.write(exp_string)
+            # export to visual file-types, listing each file once it is written
+            with open(f"{dir_name}/{base_name}_info.json", "wb") as json_file:
+                files = self._export_files(layers, f"{dir_name}/{base_name}", exp_type)
+                util.dump_members(json_file, slice_data, "files", files)
                 log.debug(f"Export to {dir_name} finished.")
 
             return True
@@ -178,18 +620,243 @@ class STLSlicer:
         else:
             log.error(
                 f"Extension '{exp_type}' not supported. "
-                f"Currently supported: ['json', 'dxf', 'svg']"
+                f"Currently supported: ['json.gz', 'json', 'dxf', 'svg']"
             )
 
             return False
 
+    @staticmethod
+    def _export_files(layers, base_name, exp_type):
+        """
+        Export every layer to its own file. The files are independent,
+        so they are written by a thread pool.
+
+        :param layers: Dictionary of layer height and `trimesh.Path2D`.
+        :param base_name: Path and file name prefix of the layer files.
+        :param exp_type: [`dxf`, `svg`]
+        :return: Generator of layer height and file name of exported layers,
+            in order of `layers`.
+        """
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for height, path2D in layers.items():
+                layer_filename_full = f"{base_name}_{height}.{exp_type}"
+                future = executor.submit(
+                    _export_layer, path2D, layer_filename_full, exp_type
+                )
+                futures[future] = height, layer_filename_full
+
+            # in submission order, i.e. by height, each as soon as it is written
+            for future in futures:
+                height, layer_filename_full = futures[future]
+                try:
+                    future.result()
+                except AttributeError:
+                    log.debug(f"{layer_filename_full} not created. No data to display.")
+                    continue
+                yield height, layer_filename_full
+
+
+@functools.lru_cache(maxsize=None)
+def _cuda_kernel(real_t):
+    """
+    Compile `CUDA_SECTION_SOURCE` for the given float type once.
+    """
+    return cupy.RawKernel(
+        CUDA_SECTION_SOURCE, "section_z", options=(f"-Dreal_t={real_t}",)
+    )
+
+
+@functools.lru_cache(maxsize=4)
+def _load_stl(f, mtime):
+    """
+    Load a mesh without merging vertices. Cached, so slicing the same
+    file at several resolutions only parses it once, `mtime` makes
+    the cache miss when the file has been modified.
+    """
+    return trimesh.load(f, process=False)
+
+
+def _export_layer(path2D, file_obj, file_type):
+    """
+    Export a single layer, raises AttributeError for empty layers (None).
+    """
+    path2D.export(file_obj=file_obj, file_type=file_type)
+
+
+def _section_triangles(triangles, tri_zmin, tri_zmax, face_ids, origin, heights):
+    """
+    Cross sections of a triangle soup with planes parallel to XY.
+    Module level so it can run in a process pool.
+
+    :param triangles: (m, 3, 3) Triangle vertices, sorted by lowest z.
+    :param tri_zmin: (m, ) Lowest z of every triangle, ascending.
+    :param tri_zmax: (m, ) Highest z of every triangle.
+    :param face_ids: (m, ) Face index of every triangle in the mesh.
+    :param origin: (3, ) Point on the plane at height 0.
+    :param heights: (n, ) Ascending offsets along Z from `origin`.
+    :return: (n, ) `trimesh.Path2D` or None
+    """
+    # compute in the float type of the triangles
+    origin = np.asanyarray(origin, dtype=triangles.dtype)
+    heights = np.asanyarray(heights, dtype=triangles.dtype)
+
+    tallest = _tallest(tri_zmin, tri_zmax)
+    starts, stops = _z_candidates(tri_zmin, tallest, origin[2] + heights)
+
+    paths = [None] * len(heights)
+    for i, height in enumerate(heights):
+        z = origin[2] + height
+        # refine the candidate range to the triangles reaching up to the plane
+        bucket = starts[i] + np.flatnonzero(tri_zmax[starts[i] : stops[i]] >= z)
+        segments, index = _triangle_segments(triangles[bucket], z)
+        if len(segments) == 0:
+            continue
+        paths[i] = _segments_path(segments, face_ids[bucket[index]], origin, height)
+    return paths
+
+
+def _segments_path(segments, face_index, origin, height):
+    """
+    Build the cross section of one layer from unordered segments.
+
+    :param segments: (m, 2, 2) XY segments.
+    :param face_index: (m, ) Face of every segment.
+    :param origin: (3, ) Point on the plane at height 0.
+    :param height: Offset of the plane along Z from `origin`.
+    :return: `trimesh.Path2D` or None
+    """
+    points = (segments - origin[:2]).reshape((-1, 2))
+    return _stitch_path(
+        points,
+        np.arange(len(points)).reshape((-1, 2)),
+        origin,
+        height,
+        face_index,
+    )
+
+
+def _z_candidates(tri_zmin, tallest, z):
+    """
+    Range of triangles sorted by lowest z which may reach the planes at `z`.
+
+    A triangle reaching a plane starts at most one triangle height below it,
+    so the range only depends on the tallest triangle.
+
+    :param tri_zmin: (m, ) Lowest z of every triangle, ascending.
+    :param tallest: Largest z-extent of a triangle.
+    :param z: (n, ) Absolute heights of the planes.
+    :return: (n, ) start and (n, ) stop indices into the triangles.
+    """
+    starts = np.searchsorted(tri_zmin, z - tallest, side="left")
+    stops = np.searchsorted(tri_zmin, z, side="right")
+    return starts, stops
+
+
+def _tallest(tri_zmin, tri_zmax):
+    """
+    Largest z-extent of the triangles, 0.0 if there are none.
+    """
+    return float((tri_zmax - tri_zmin).max()) if len(tri_zmin) else 0.0
+
+
+def _stitch_path(points, segments, origin, height, face_index):
+    """
+    Build the cross section of one layer from intersected edges.
+
+    :param points: (n, 2) Intersection points in the plane.
+    :param segments: (m, 2) Indices into `points` connected by a face.
+    :param origin: (3, ) Point on the plane at height 0.
+    :param height: Offset of the plane along Z from `origin`.
+    :param face_index: (m, ) Face of every segment.
+    :return: `trimesh.Path2D` or None
+    """
+    if len(segments) == 0:
+        return None
+
+    # merge coincident points, i.e. where a vertex lies on the plane
+    unique, inverse = trimesh.grouping.unique_rows(points)
+    segments = inverse[segments]
+    keep = np.flatnonzero(segments[:, 0] != segments[:, 1])
+    if len(keep) == 0:
+        return None
+
+    # an edge lying in the plane is found by both of its faces
+    _, first = np.unique(np.sort(segments[keep], axis=1), axis=0, return_index=True)
+    keep = keep[np.sort(first)]
+
+    to_3D = np.eye(4)
+    to_3D[:3, 3] = origin + [0.0, 0.0, height]
+    polylines = util.stitch_segments(segments[keep], len(unique))
+    return trimesh.path.Path2D(
+        entities=[
+            trimesh.path.entities.Line(points=p) for p in polylines if len(p) > 1
+        ],
+        vertices=points[unique],
+        metadata={"to_3D": to_3D, "face_index": face_index[keep]},
+        process=False,
+    )
+
+
+def _triangle_segments(triangles, z):
+    """
+    Intersect triangles with the plane at `z`.
+
+    Vertices on the plane count as below it, so every intersected triangle
+    has exactly two crossing edges. Segments collapsed to a point are dropped.
+
+    :param triangles: (m, 3, 3) Triangle vertices.
+    :param z: Height of the plane.
+    :return: (k, 2, 2) XY segments and (k, ) indices into `triangles`
+    """
+    dist = triangles[:, :, 2] - z
+    above = dist > 0
+    # edges (0, 1), (1, 2), (2, 0)
+    crossing = above != above[:, [1, 2, 0]]
+    hit = crossing.any(axis=1)
+
+    # two crossing edges per intersected triangle, in triangle order
+    face, edge = np.nonzero(crossing)
+    start = np.where(above[face, edge], (edge + 1) % 3, edge)
+    end = np.where(above[face, edge], edge, (edge + 1) % 3)
+
+    # interpolate from the vertex below to the vertex above, so an edge
+    # shared by two triangles yields a bit-identical point in both
+    d0 = dist[face, start]
+    d1 = dist[face, end]
+    v0 = triangles[face, start, :2]
+    v1 = triangles[face, end, :2]
+    points = v0 + (d0 / (d0 - d1))[:, None] * (v1 - v0)
+
+    segments = points.reshape((-1, 2, 2))
+    keep = (segments[:, 0] != segments[:, 1]).any(axis=1)
+
+    return segments[keep], np.flatnonzero(hit)[keep]
+
 
 def repair_mesh_watertight(mesh):
-    if not mesh.is_watertight:
-        log.debug(f"Mesh not watertight. Fixing normals.")
-        if not mesh.fix_normals:
-            log.debug(f"Mesh not watertight. Filling holes.")
-            if not mesh.fill_holes:
-                log.debug(f"Mesh is not watertight. Not fixed!")
-                return False
-    return True
+    """
+    Try to make the mesh watertight, stopping as soon as it is.
+
+    :param mesh: `trimesh.Trimesh`, repaired in place.
+    :return: True if the mesh is watertight.
+    """
+    if mesh.is_watertight:
+        return True
+    # a soup of disconnected triangles never registers as watertight,
+    # and fill_holes would close every single triangle with a copy
+    log.debug(f"Mesh not watertight. Merging vertices.")
+    mesh.merge_vertices()
+    if mesh.is_watertight:
+        return True
+    log.debug(f"Mesh not watertight. Fixing normals.")
+    mesh.fix_normals()
+    if mesh.is_watertight:
+        return True
+    log.debug(f"Mesh not watertight. Filling holes.")
+    mesh.fill_holes()
+    if mesh.is_watertight:
+        return True
+    log.debug(f"Mesh is not watertight. Not fixed!")
+    return False
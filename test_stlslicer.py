@@ -0,0 +1,197 @@
+import gzip
+import json
+import os
+
+import numpy as np
+import pytest
+import trimesh
+
+import util
+from stlslicer import STLSlicer, _load_stl, repair_mesh_watertight
+
+
+def load(tmp_path, mesh, name="mesh.stl", **kwargs):
+    stl_file = tmp_path / name
+    mesh.export(stl_file)
+    slicer = STLSlicer()
+    slicer.load_mesh(str(stl_file), **kwargs)
+    return slicer
+
+
+def assert_same_layers(layers, reference):
+    assert list(layers.keys()) == list(reference.keys())
+    for height, path2D in reference.items():
+        if path2D is None:
+            assert layers[height] is None
+            continue
+        assert np.isclose(layers[height].length, path2D.length), height
+        assert np.isclose(layers[height].area, path2D.area), height
+
+
+def section_multiplane(slicer, distance):
+    origin, heights = slicer._layer_heights(distance)
+    sections = slicer.mesh.section_multiplane(origin, [0, 0, 1], heights)
+    return dict(zip(heights.tolist(), sections))
+
+
+def test_fast_slice_vertex_ring_on_plane(tmp_path):
+    # layer 0 runs through the lowest vertex ring of the torus, whose
+    # edges are found by both of their faces
+    slicer = load(tmp_path, trimesh.creation.torus(10, 3))
+
+    fast = slicer.fast_slice(1.0)
+    assert_same_layers(fast, slicer.slice_mesh(1.0, workers=1))
+    for path2D in fast.values():
+        if path2D is not None:
+            assert all(entity.closed for entity in path2D.entities)
+
+
+def test_slice_bodies_sharing_an_edge(tmp_path):
+    # every layer is two squares touching in one point
+    mesh = trimesh.util.concatenate(
+        [
+            trimesh.creation.box(bounds=[[0, 0, 0], [1, 1, 1]]),
+            trimesh.creation.box(bounds=[[-1, -1, 0], [0, 0, 1]]),
+        ]
+    )
+    slicer = load(tmp_path, mesh)
+    reference = section_multiplane(slicer, 0.25)
+
+    # the planes at the bottom and top faces are ill-posed
+    for layers in [slicer.fast_slice(0.25), slicer.slice_mesh(0.25, workers=1)]:
+        for height in [0.25, 0.5, 0.75]:
+            assert np.isclose(layers[height].length, 8.0)
+            assert np.isclose(layers[height].length, reference[height].length)
+            # trimesh itself does not split the polygons at the touching point
+            assert np.isclose(layers[height].area, 2.0)
+
+
+def test_slice_mesh_plane_normal(tmp_path):
+    bar = trimesh.creation.box(bounds=[[10, 0, 0], [50, 4, 4]])
+    slicer = load(tmp_path, bar)
+
+    layers = slicer.slice_mesh(1.0, workers=1, plane_normal=[2, 0, 0])
+
+    assert len(layers) == 41
+    for height in list(layers)[1:-1]:
+        path2D = layers[height]
+        assert np.isclose(path2D.area, 16.0)
+        assert np.isclose(path2D.metadata["to_3D"][0, 3], 10.0 + height)
+
+
+@pytest.mark.parametrize(
+    "exp_type, open_file", [("json", open), ("json.gz", gzip.open)]
+)
+def test_export_layers_json_round_trip(tmp_path, exp_type, open_file):
+    slicer = load(tmp_path, trimesh.creation.icosphere(), name="sphere.stl")
+    layers = slicer.slice_mesh(0.25, workers=1)
+    path2D = layers[1.0]
+    path2D.metadata["closed"] = np.array([e.closed for e in path2D.entities])
+    path2D.metadata["count"] = np.arange(len(path2D.entities), dtype=np.int16)
+
+    assert slicer.export_layers(exp_type)
+    with open_file(tmp_path / f"sphere.{exp_type}", "rb") as exp_file:
+        data = json.loads(exp_file.read(), object_hook=util.numpy_object_hook)
+
+    assert data["watertight"] is True
+    assert list(data["layers"]) == [str(height) for height in layers]
+    for height, path2D in layers.items():
+        exported = data["layers"][str(height)]
+        if path2D is None:
+            assert exported is None
+            continue
+        vertices = exported["vertices"]
+        assert vertices.dtype == path2D.vertices.dtype
+        assert vertices.shape == path2D.vertices.shape
+        assert np.array_equal(vertices, path2D.vertices)
+    metadata = data["layers"]["1.0"]["metadata"]
+    for key in ["closed", "count"]:
+        assert metadata[key].dtype == layers[1.0].metadata[key].dtype
+        assert np.array_equal(metadata[key], layers[1.0].metadata[key])
+
+
+def test_repair_mesh_watertight_keeps_watertight_mesh():
+    mesh = trimesh.creation.icosphere()
+    vertices = mesh.vertices.copy()
+    faces = mesh.faces.copy()
+
+    assert repair_mesh_watertight(mesh)
+    assert np.array_equal(mesh.vertices, vertices)
+    assert np.array_equal(mesh.faces, faces)
+
+
+def test_repair_mesh_watertight_open_mesh():
+    mesh = trimesh.creation.icosphere()
+    mesh.update_faces(mesh.triangles_center[:, 2] < 0.5)
+
+    assert not repair_mesh_watertight(mesh)
+
+
+def test_load_mesh_resets_watertight(tmp_path):
+    slicer = load(tmp_path, trimesh.creation.icosphere(), name="closed.stl")
+    assert slicer.mesh_watertight
+
+    open_mesh = trimesh.creation.icosphere()
+    open_mesh.update_faces(open_mesh.triangles_center[:, 2] < 0.5)
+    open_mesh.export(tmp_path / "open.stl")
+    slicer.load_mesh(str(tmp_path / "open.stl"))
+    assert not slicer.mesh_watertight
+
+
+def test_load_stl_cache(tmp_path):
+    stl_file = tmp_path / "sphere.stl"
+    trimesh.creation.icosphere().export(stl_file)
+    f = str(stl_file)
+
+    slicer = STLSlicer()
+    slicer.load_mesh(f)
+    cached = _load_stl(f, os.path.getmtime(f))
+    hits = _load_stl.cache_info().hits
+    slicer.load_mesh(f)
+    assert _load_stl.cache_info().hits == hits + 1
+
+    # the repairs merged the copy, not the cached soup
+    assert len(slicer.mesh.vertices) < len(cached.vertices)
+    assert len(cached.vertices) == 3 * len(cached.faces)
+
+    mtime = os.path.getmtime(f) + 10
+    os.utime(f, (mtime, mtime))
+    misses = _load_stl.cache_info().misses
+    slicer.load_mesh(f)
+    assert _load_stl.cache_info().misses == misses + 1
+    assert _load_stl(f, mtime) is not cached
+
+
+def tower(rings=20, spacing=0.1, size=10.0):
+    """
+    Square tower with a ring of vertices every `spacing` along Z.
+    """
+    square = np.array([[0, 0], [size, 0], [size, size], [0, size]])
+    vertices = np.array(
+        [[x, y, k * spacing] for k in range(rings + 1) for x, y in square]
+    )
+    faces = []
+    for k in range(rings):
+        for i in range(4):
+            a = 4 * k + i
+            b = 4 * k + (i + 1) % 4
+            faces += [[a, b, b + 4], [a, b + 4, a + 4]]
+    top = 4 * rings
+    faces += [[0, 2, 1], [0, 3, 2], [top, top + 1, top + 2], [top, top + 2, top + 3]]
+    return trimesh.Trimesh(vertices, faces)
+
+
+@pytest.mark.parametrize("mesh", [tower(), trimesh.creation.torus(10, 3)])
+def test_slice_mesh_fp32_workers(tmp_path, mesh):
+    reference = load(tmp_path, mesh).slice_mesh(0.1, workers=1)
+    slicer = load(tmp_path, mesh, use_fp32=True)
+
+    layers = slicer.slice_mesh(0.1, workers=3)
+
+    assert list(layers.keys()) == list(reference.keys())
+    for height, path2D in reference.items():
+        if path2D is None:
+            assert layers[height] is None
+            continue
+        assert layers[height] is not None, height
+        assert np.isclose(layers[height].area, path2D.area, rtol=1e-5), height
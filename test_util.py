@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+import util
+
+
+@pytest.mark.parametrize(
+    "arr",
+    [
+        np.array([True, False, True]),
+        np.arange(5, dtype=np.int8),
+        np.arange(4, dtype=np.uint16).reshape((2, 2)),
+        np.arange(3, dtype=np.int64),
+        np.array([0.1, 2.5]),
+        np.array([0.1], dtype=np.float32),
+        np.arange(6.0)[::2],
+    ],
+)
+def test_dumps_same_with_and_without_orjson(arr, monkeypatch):
+    pytest.importorskip("orjson")
+    data = {"arr": arr, "scalar": arr[0]}
+    exp_bytes = util.dumps(data)
+    monkeypatch.setattr(util, "orjson", None)
+    assert util.dumps(data) == exp_bytes
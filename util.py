@@ -1,22 +1,218 @@
-import collections
+import base64
+import functools
 import json
 import numpy as np
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:
+
+    def njit(*args, **kwargs):
+        """
+        Stand-in for `numba.njit` if numba is not installed,
+        the decorated function runs as plain Python.
+        """
+        return lambda func: func
+
+
+# small integer arrays are exported as raw bytes instead of lists
+PACKED_DTYPES = {np.dtype(t) for t in (np.int8, np.uint8, np.int16, np.uint16)}
+
 
 class NumpyArrayEncoder(json.JSONEncoder):
+    # encoding function per class, filled on first sight of each class
+    handlers = {}
+
+    @classmethod
+    def handler(cls, obj_cls):
+        try:
+            return cls.handlers[obj_cls]
+        except KeyError:
+            handler = cls.handlers[obj_cls] = encoder_for(obj_cls)
+            return handler
+
     def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif is_instance_named(obj, "bool_"):
-            return bool(str(obj))
-        elif is_instance_named(obj, "Path2D"):
-            return obj.to_dict()
-        else:
+        handler = self.handler(obj.__class__)
+        if handler is None:
             return super(NumpyArrayEncoder, self).default(obj)
+        return handler(obj)
+
+
+def encoder_for(cls):
+    """
+    Find the function `NumpyArrayEncoder` uses for instances of `cls`.
+
+    Parameters
+    ------------
+    cls : type
+      Class of the objects to encode
+
+    Returns
+    ---------
+    handler : callable or None
+      Converts an instance to JSON serializable data
+    """
+    if issubclass(cls, np.bool_):
+        return bool
+    elif issubclass(cls, np.integer):
+        return int
+    elif issubclass(cls, np.floating):
+        return float
+    elif issubclass(cls, np.ndarray):
+        return encode_ndarray
+    elif _type_named_cls(cls, "Path2D") is not None:
+        return encode_path
+    return None
+
+
+def encode_ndarray(obj):
+    """
+    Convert an array to a list, or pack boolean and small
+    integer arrays into hex strings.
+    """
+    if obj.dtype == np.bool_:
+        return {
+            "__bits__": np.packbits(obj).tobytes().hex(),
+            "shape": obj.shape,
+        }
+    elif obj.dtype in PACKED_DTYPES:
+        return {
+            "__np__": np.ascontiguousarray(obj).tobytes().hex(),
+            "dtype": obj.dtype.str,
+            "shape": obj.shape,
+        }
+    return obj.tolist()
+
+
+def encode_path(path):
+    """
+    Convert a `Path2D` to a dictionary like `Path2D.to_dict()`, but
+    with the vertices as base64 encoded bytes instead of nested lists.
+    """
+    return {
+        "vertices": np_blob(path.vertices),
+        "entities": [e.to_dict() for e in path.entities],
+        "metadata": path.metadata,
+    }
+
+
+def np_blob(arr):
+    """
+    Describe an array by its base64 encoded bytes, dtype and shape.
+    """
+    arr = np.ascontiguousarray(arr)
+    return {
+        "b64": base64.b64encode(arr.tobytes()).decode(),
+        "dtype": arr.dtype.str,
+        "shape": arr.shape,
+    }
+
+
+def numpy_object_hook(obj):
+    """
+    `object_hook` for `json.loads`, restores the arrays packed
+    by `NumpyArrayEncoder` and `np_blob`.
+    """
+    if "__bits__" in obj:
+        shape = tuple(obj["shape"])
+        bits = np.frombuffer(bytes.fromhex(obj["__bits__"]), dtype=np.uint8)
+        return (
+            np.unpackbits(bits, count=int(np.prod(shape))).astype(bool).reshape(shape)
+        )
+    elif "__np__" in obj:
+        data = bytes.fromhex(obj["__np__"])
+        return np.frombuffer(data, dtype=obj["dtype"]).reshape(obj["shape"])
+    elif "b64" in obj:
+        data = base64.b64decode(obj["b64"])
+        return np.frombuffer(data, dtype=obj["dtype"]).reshape(obj["shape"])
+    return obj
+
+
+def orjson_default(obj):
+    """
+    `default` hook for `orjson.dumps`, encodes like `NumpyArrayEncoder`.
+
+    Arrays are not serialized natively by orjson, so boolean and small
+    integer arrays are packed the same way with both encoders.
+    """
+    handler = NumpyArrayEncoder.handler(obj.__class__)
+    if handler is None:
+        raise TypeError
+    return handler(obj)
+
+
+def dumps(obj, indent=True):
+    """
+    Serialize `obj` to JSON bytes, with orjson if available.
+
+    Parameters
+    ------------
+    obj : object
+      Data containing numpy arrays/scalars or `Path2D` objects
+    indent : bool
+      Indent nested data by two spaces
+
+    Returns
+    ---------
+    exp_bytes : bytes
+      UTF-8 encoded JSON
+    """
+    if orjson is None:
+        # same separators and raw UTF-8 as orjson, so the output does not
+        # depend on which one is installed
+        return json.dumps(
+            obj,
+            cls=NumpyArrayEncoder,
+            indent=2 if indent else None,
+            separators=(",", ": ") if indent else (",", ":"),
+            ensure_ascii=False,
+        ).encode()
+    option = orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=orjson_default, option=option)
+
+
+def dump_members(fp, obj, key, members):
+    """
+    Write the dictionary `obj` plus the member `key` to a file,
+    the items of `key` are serialized and written one at a time.
+
+    Parameters
+    ------------
+    fp : file object
+      Opened in binary mode
+    obj : dict
+      Static members, written first
+    key : str
+      Name of the streamed member
+    members : iterable of (key, value)
+      Items of the streamed member, one line each
+    """
+    fp.write(b"{\n")
+    for name, value in obj.items():
+        fp.write(b"  " + _member(name, value) + b",\n")
+    # '"key": {}' without the braces
+    fp.write(b"  " + _member(key, {})[:-2] + b"{")
+    separator = b"\n    "
+    for name, value in members:
+        fp.write(separator + _member(name, value))
+        separator = b",\n    "
+    fp.write(b"\n  }\n}" if separator != b"\n    " else b"}\n}")
+
+
+def _member(name, value):
+    """
+    Serialize a single `"name": value` pair of a JSON object.
+    """
+    # dump a one item dictionary and strip its braces,
+    # so `name` is converted to a string like any other key
+    return dumps({name: value}, indent=False)[1:-1]
 
 
 def is_instance_named(obj, name):
@@ -57,27 +253,117 @@ def type_named(obj, name):
     ----------
     named class, or None
     """
-    # if obj is a member of the named class, return True
-    name = str(name)
-    if obj.__class__.__name__ == name:
-        return obj.__class__
-    for base in type_bases(obj):
+    named = _type_named_cls(obj.__class__, str(name))
+    if named is None:
+        raise ValueError("Unable to extract class of name " + name)
+    return named
+
+
+@functools.lru_cache(maxsize=None)
+def _type_named_cls(cls, name):
+    """
+    Class or base class of `cls` called `name`, or None.
+    Cached, as the class hierarchy does not change.
+    """
+    # if cls is the named class, return it
+    if cls.__name__ == name:
+        return cls
+    for base in _class_bases(cls):
         if base.__name__ == name:
             return base
-    raise ValueError("Unable to extract class of name " + name)
+    return None
 
 
 def type_bases(obj, depth=4):
     """
     Return the bases of the object passed.
     """
-    bases = collections.deque([list(obj.__class__.__bases__)])
-    for i in range(depth):
-        bases.append([i.__base__ for i in bases[-1] if i is not None])
-    try:
-        bases = np.hstack(bases)
-    except IndexError:
-        bases = []
-    # we do the hasattr as None/NoneType can be in the list of bases
-    bases = [i for i in bases if hasattr(i, "__name__")]
-    return np.array(bases)
+    return _class_bases(obj.__class__, depth)
+
+
+def _class_bases(cls, depth=4):
+    """
+    Return the bases of the class passed.
+    """
+    bases = []
+    level = list(cls.__bases__)
+    for i in range(depth + 1):
+        bases.extend(level)
+        # object.__base__ is None
+        level = [i.__base__ for i in level if i.__base__ is not None]
+    return bases
+
+
+@njit(cache=True)
+def stitch_segments(segments, count):
+    """
+    Chain line segments into polylines.
+
+    Points shared by two segments are joined. Polylines end at points shared
+    by one or more than two segments, e.g. where two bodies of a mesh touch
+    the plane in the same point, so no segment is dropped.
+
+    Parameters
+    ------------
+    segments : (m, 2) int
+      Point indices of the segments
+    count : int
+      Number of points
+
+    Returns
+    ---------
+    polylines : list of (n, ) int
+      Point indices of each polyline, closed ones end with their first index
+    """
+    # adjacency of every point, CSR style: the neighbours of point `i` are
+    # neighbours[offsets[i]:offsets[i + 1]], reached by segment edges[...]
+    degree = np.zeros(count, dtype=np.int64)
+    for i in range(len(segments)):
+        degree[segments[i, 0]] += 1
+        degree[segments[i, 1]] += 1
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(degree)
+    neighbours = np.empty(offsets[-1], dtype=np.int64)
+    edges = np.empty(offsets[-1], dtype=np.int64)
+    fill = offsets[:-1].copy()
+    for i in range(len(segments)):
+        a = segments[i, 0]
+        b = segments[i, 1]
+        neighbours[fill[a]] = b
+        edges[fill[a]] = i
+        fill[a] += 1
+        neighbours[fill[b]] = a
+        edges[fill[b]] = i
+        fill[b] += 1
+
+    used = np.zeros(len(segments), dtype=np.bool_)
+    buffer = np.empty(len(segments) + 1, dtype=np.int64)
+    polylines = []
+    # start at the ends and junctions first, the rest are closed loops
+    for junctions in (True, False):
+        for start in range(count):
+            if junctions and degree[start] == 2:
+                continue
+            while True:
+                length = 0
+                current = start
+                while True:
+                    buffer[length] = current
+                    length += 1
+                    following = -1
+                    for j in range(offsets[current], offsets[current + 1]):
+                        if not used[edges[j]]:
+                            used[edges[j]] = True
+                            following = neighbours[j]
+                            break
+                    if following < 0:
+                        break
+                    current = following
+                    if current == start or degree[current] != 2:
+                        buffer[length] = current
+                        length += 1
+                        break
+                if length < 2:
+                    break
+                polylines.append(buffer[:length].copy())
+    return polylines